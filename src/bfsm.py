@@ -10,7 +10,8 @@
 # itself. In principle stimuli from both sources are entered into the same queue
 # (FIFO) within the BFSM, and are retrieved once the BFSM is ready to handle the
 # next stimulus. Some internal stimuli are in fact modifiers on the stimulus
-# being handled: these are passed via the high-priority queue.
+# being handled: these are passed via the high-priority slot, which holds at
+# most one stimulus and is examined before the queue.
 #
 # If the new state equals the special value 'Revert', the next state will be the
 # previous state of the FSM. This feature may come handy in case of error and
@@ -23,13 +24,28 @@
 # If this FSM will be part of an object, in which case the actions will be
 # methods of the embedding object, the references to the actions should be
 # 'bound method references'. This can be enforced using function
-# types.MethodType.
+# types.MethodType. An event action or a state action may be None, in which
+# case no action is performed. This avoids the call of an action which does
+# nothing.
+#
+# States and stimuli are typically strings. The names are interned when the
+# BFSM is built, thus comparisons and dictionary lookups of the names mostly
+# succeed on identity. Callers should preferably use interned strings too, which
+# is the case for string literals which look like identifiers. Any other
+# hashable object, for instance an enum.IntEnum member, can be used as well.
 #
 # Written by W.J.M. Nelis, wim.nelis@ziggo.nl, 2018.01
 #
-import queue
+from array import array
+from collections import deque
+import sys
 
 _debug_fsm_= True			# Control debug output
+# Define the buffer which receives the trace of the (state,stimulus) history if
+# a trace is requested. It is shared by all fsm's and cleared upon each call of
+# the interpreter with tracing, thus the trace is valid until the next such
+# call.
+_trace_= deque( maxlen=256 )		# Trace of {state,stimulus} history
 # Define the initial state of the fsm. This state MUST be defined in the
 # transition matrix.
 _state_init_ = 'Init'			# Required state
@@ -37,6 +53,151 @@ _state_init_ = 'Init'			# Required state
 # This state can only be used as the 'new state', it cannot be used as a (valid)
 # state to address an element in the transition matrix.
 _state_revert_= 'Revert'		# Pseudo state, revert to previous state
+# Define the value which replaces the index of the new state in the decision
+# table if the new state is the pseudo state 'Revert'.
+_index_revert_= -1			# Marker, revert to previous state
+# Define the number of previous states remembered by the fsm. Upon a transition
+# to pseudo state 'Revert', the most recent one is removed and used as the new
+# state. The state being left is then remembered, like upon any transition.
+_history_size_= 4			# Number of previous states remembered
+
+#
+# Function _MakeInterpreter returns the interpreter of a BFSM. The interpreter
+# fetches the next stimulus from either the high-prior slot or the default
+# queue, determines it's new state and invokes the associated action(s). If the
+# stimuli queues are empty the interpreter stops, that is it returns control to
+# it's caller.
+#
+# The source of the interpreter is generated, leaving out the parts which are
+# not needed for a specific BFSM: the trace of the (state,stimulus) history if
+# no trace is requested, the state actions if no state action is defined and the
+# handling of pseudo state 'Revert' if it is not used in the decision table. If
+# a trace is kept, buffer _trace_ is returned, otherwise None is returned. There
+# are at most eight variants, each of which is compiled only once.
+#
+# The interpreter does not validate the stimuli. All entries in the decision
+# table are checked when the BFSM is built, and ReportEvent checks the stimulus
+# unless python runs optimized. An unknown stimulus still causes a KeyError.
+#
+_Interpreters= {}			# Compiled interpreter variants
+
+def _MakeInterpreter( Trace, StaAct, Revert ):
+  Key= (Trace,StaAct,Revert)
+  if Key in _Interpreters:
+    return _Interpreters[Key]
+
+  Src= [ 'def _Interpret( self ):',
+         '  DefQueue= self.DefQueue',	# Bind loop invariant attributes to
+         '  ACT     = self._ACT',		#   local names
+         '  NS      = self._Schema.NS',
+         '  NStim   = self._Schema.NStim',
+         '  StaFns  = self._StaFn',
+         '  StimId  = self._StimId',
+         '  States  = self.States',
+         '  History = self._History' ]
+  if Trace:
+    Src+= [ '  trace= _trace_',
+            '  trace.clear()' ]
+  Src+= [ '  while True:',
+          '    Stim= self._Pri',
+          '    if Stim is not None:',	# High priority stimulus
+          '      self._Pri= None',
+          '      Par= None',
+          '    else:',
+          '      try:',
+          '        (Stim,Par)= DefQueue.popleft()',
+          '      except IndexError:',	# Queue is empty
+          '        return ' + ('trace' if Trace else 'None'),
+          '    self.Parametr= Par' ]
+  if Trace:
+    Src+= [ '    trace.append( "State: {}, Stim: {}, Par: {}".format(',
+            '                  self.State, Stim, Par ) )' ]
+  Src+= [ '    i= self._StateIdx*NStim + StimId[Stim]',
+          '    NewIdx= NS[i]',
+          '    Action= ACT[i]' ]
+  if Revert:				# Revert to the previous state
+    Src+= [ '    if NewIdx == _index_revert_:',
+            '      NewIdx= History.pop()' ]
+  Src+= [ '    NewState= States[NewIdx]',
+          '    self.Stimulus= Stim' ]
+  if StaAct:				# Perform the state action
+    Src+= [ '    StaFn= StaFns[NewIdx]',
+            '    if StaFn is not None:',
+            '      self.NxtState= NewState',
+            '      StaFn()' ]
+  Src+= [ '    if Action is not None:',	# Perform the event action
+          '      if Par is None:',
+          '        Action()',
+          '      else:',
+          '        Action( Par )',
+          '    self.PrvState= self.State',	# Change the state
+          '    History.append( self._StateIdx )',
+          '    self.State   = NewState',
+          '    self._StateIdx= NewIdx' ]
+  if StaAct:				# NxtState is only set if there are
+    Src+= [ '    self.NxtState= None' ]	#   state actions
+
+  Namespace= { '_index_revert_': _index_revert_, '_trace_': _trace_ }
+  exec( '\n'.join( Src ), Namespace )
+  _Interpreters[Key]= Namespace['_Interpret']
+  return _Interpreters[Key]
+
+
+#
+# Function _Intern returns the interned version of a name of a state or of a
+# stimulus if it is a string, otherwise the name itself.
+#
+def _Intern( Name ):
+  return sys.intern( Name ) if type(Name) is str else Name
+
+#
+# Class _Schema contains the part of the administration of a BFSM which can be
+# derived from the decision table alone: the lists of states and stimuli, their
+# integer encoding and the index of the new state of each (state,stimulus)-pair.
+# It is built once per BFSM. It is not cached and shared between BFSMs: emsbus
+# builds a new decision table, with bound actions, for each FSM, and a cache
+# keyed on the identity of a mutable table could return a stale schema if the
+# table is changed after a BFSM is built from it.
+#
+class _Schema:
+  '''The derived, action independent part of a BFSM decision table'''
+
+  def __init__( self, Matrix ):
+   # Build a list of all possible states and a list of all possible stimuli, by
+   # reading the keys of matrix Matrix. The order of the stimuli is the order in
+   # which they are first found. The sets contain the same elements, and are
+   # used for the membership tests.
+    self.States = [ _Intern(State) for State in Matrix ]	# List of states
+    self.Stimuli= list( dict.fromkeys(	# List of stimuli
+                    _Intern(Stim) for Row in Matrix.values() for Stim in Row ) )
+    self.StatesSet = set( self.States  )
+    self.StimuliSet= set( self.Stimuli )
+
+   # Check the matrix to be complete, and see if the new state in each entry
+   # does exist. A row is complete if its set of stimuli equals the set of all
+   # stimuli.
+    assert _state_init_ in self.StatesSet	# This state should be defined
+    assert _state_revert_ not in self.StatesSet
+    NewStates= set()
+    for Row in Matrix.values():
+      assert Row.keys() == self.StimuliSet
+      NewStates.update( Entry[0] for Entry in Row.values() )
+    NewStates.discard( _state_revert_ )
+    assert NewStates <= self.StatesSet
+
+   # Assign a small integer to each state and to each stimulus, and determine
+   # the index of the new state for each entry in the decision table. The table
+   # is stored in a one dimensional array of C integers, entry (state,stimulus)
+   # being located at offset state*NStim+stimulus. The pseudo state 'Revert' is
+   # encoded as _index_revert_.
+    self.StateId= { State: i for i,State in enumerate(self.States ) }
+    self.StimId = { Stim : i for i,Stim  in enumerate(self.Stimuli) }
+    self.NStim  = len( self.Stimuli )
+    self.NS     = array( 'i', [ _index_revert_ if Matrix[State][Stim][0] == _state_revert_
+                                else self.StateId[Matrix[State][Stim][0]]
+                                for State in self.States for Stim in self.Stimuli ] )
+    self.Revert = _index_revert_ in self.NS
+
 
 class Bfsm:
   '''A very basic Finite State Machine'''
@@ -45,116 +206,84 @@ class Bfsm:
     self.Matrix= Matrix			# Decision table of the FSM
     self.StaAct= StaAct			# State pre- and post-action vector
 
-   # Build a list of all possible states and a list of all possible stimuli, by
-   # reading the keys of matrix Matrix.
-    self.States = []			# Preset list of states
-    self.Stimuli= []			# Preset list of stimuli
-    for State in Matrix:
-      self.States.append( State )
-      for Stim in Matrix[State]:
-        if not Stim in self.Stimuli:
-          self.Stimuli.append( Stim )
-
-   # Check the matrix to be complete, and see if the new state in each entry
-   # does exist.
-    assert _state_init_ in self.States	# This state should be defined
-    assert _state_revert_ not in self.States
-    for State in self.States:
-#     assert State in Matrix		# This assertion should never fail
-      for Stim in self.Stimuli:
-        assert Stim in Matrix[State]
-        nextstate= Matrix[State][Stim][0]
-        if nextstate != _state_revert_:
-          assert nextstate in self.States
+   # Derive the action independent information from the decision table.
+    Schema= _Schema( Matrix )
+    self._Schema    = Schema
+    self.States     = Schema.States
+    self.Stimuli    = Schema.Stimuli
+    self._StimuliSet= Schema.StimuliSet
+    self._StimId    = Schema.StimId
 
    # If a list of state actions is specified, make sure it contains an entry for
    # each state.
     if StaAct is not None:
       for State in StaAct:
-        assert State in self.States
+        assert State in Schema.StatesSet
       for State in self.States:
         self.StaAct.setdefault( State, None )
 
-   # Define the queues to pass the stimuli, both with normal and with high
-   # priority. Preset the object variables.
-    self.DefQueue= queue.Queue( 16 )
-    self.PriQueue= queue.Queue(  2 )
+   # Build the list of event actions, parallel to the array with the indices of
+   # the new states in the schema, and the list of state actions, indexed by
+   # the index of the state.
+    self._ACT  = [ Matrix[State][Stim][1]
+                   for State in self.States for Stim in self.Stimuli ]
+    self._StaFn= [ None if StaAct is None else StaAct[State]
+                   for State in self.States ]
+
+   # Define the queue to pass the stimuli with normal priority. Methods append
+   # and popleft of a deque are atomic, thus the queue can be filled from other
+   # threads without an additional lock. Note that the queue is not bounded: a
+   # deque with a maximum length would silently drop the oldest stimulus.
+   # A ring buffer with separate read and write indices is not used for the
+   # default queue: it is only safe with a single producer, while the default
+   # queue of an FSM in emsbus is filled by both a dispatcher thread and the
+   # watchdog timer thread.
+   # A stimulus with high priority is only entered by an action of this FSM,
+   # thus by the thread running the interpreter, and it is handled directly upon
+   # return of that action. A single slot suffices. Preset the object variables.
+    self.DefQueue= deque()
+    self._Pri    = None			# Stimulus with high priority
     self.State   = _state_init_		# Current state
     self.PrvState= None			# Previous state
+    self._StateIdx= Schema.StateId[_state_init_]
+    self._History = deque( maxlen=_history_size_ )
     self.NxtState= None			# Next state
     self.Stimulus= None			# Event
     self.Parametr= None			# Event parameter
 
- # Private method _Interpret is the interpreter of the BFSM. It fetches the next
- # stimulus from either the high-prior queue or the default queue, determines
- # it's new state and invokes the associated action(s). If the stimuli queues
- # are empty the interpreter stops, that is it returns control to it's caller.
-  def _Interpret( self ):
-    trace= []				# Trace of {state,stimulus} history
-    while ( True ):
-      Stim= None
-      if   not self.PriQueue.empty():
-        Stim=  self.PriQueue.get()
-      elif not self.DefQueue.empty():
-        Stim=  self.DefQueue.get()
-      if Stim is None:
-        return trace
-
-      if type(Stim) is tuple  and  len(Stim) == 2:
-        (Stim,self.Parametr)= Stim[:]
-      elif type(Stim) is str:
-        self.Parametr= None
-      else:
-        assert False, 'Unexpected event type'
-
-      if _debug_fsm_:
-        trace.append( "State: {}, Stim: {}, Par: {}".format(
-                      self.State, Stim, self.Parametr ) )
-      assert Stim in self.Stimuli
-      (NewState,Action)= self.Matrix[self.State][Stim][:]
-  # Handle the special (pseudo) state to revert to the previous state. It uses
-  # the previous state maintained by the fsm interpreter.
-      if NewState == _state_revert_:
-        assert self.PrvState is not None
-        NewState= self.PrvState
-
-  # Perform the state action if it defined for the next state.
-      self.Stimulus= Stim
-      if self.StaAct is not None:	# Do state action
-        if self.StaAct[NewState] is not None:
-          self.NxtState= NewState
-          self.StaAct[NewState]()
-
-  # Perform the event action and change the state.
-      if self.Parametr is None:
-        Action()
-      else:
-        Action( self.Parametr )
-      self.PrvState= self.State
-      self.State   = NewState
-      self.NxtState= None
+   # Select the variants of the interpreter needed by this BFSM, one without
+   # and one with tracing. The latter is only available if _debug_fsm_ is True.
+    StaFn= any( StaFn is not None for StaFn in self._StaFn )
+    self._Interpret     = _MakeInterpreter( False      , StaFn, Schema.Revert )
+    self._InterpretTrace= _MakeInterpreter( _debug_fsm_, StaFn, Schema.Revert )
 
  # Method ReportEvent enters the supplied stimulus in the default queue and
- # returns. The stimulus will be handled when method HandleEvent is called.
+ # returns. The stimulus will be handled when method HandleEvent is called. Each
+ # queue entry is a pair (stimulus,parameter), in which the parameter may be
+ # None.
   def ReportEvent( self, Stim, Par=None ):
-    assert Stim in self.Stimuli
-    if Par is None:
-      self.DefQueue.put( Stim )
-    else:
-      self.DefQueue.put( (Stim,Par) )
-
- # Method AugmentEvent enters the supplied stimulus in the high priority queue.
- # Typically, this method is called from an action invoked by this FSM, causing
- # this stimulus to be handled directly upon return from the action.
+    if __debug__:
+      assert Stim in self._StimuliSet
+    self.DefQueue.append( (Stim,Par) )
+
+ # Method AugmentEvent enters the supplied stimulus in the high priority slot.
+ # This method is called from an action invoked by this FSM, causing this
+ # stimulus to be handled directly upon return from the action. At most one
+ # stimulus can be entered per action.
   def AugmentEvent( self, Stim ):
-    assert Stim in self.Stimuli
-    self.PriQueue.put( Stim )
+    if __debug__:
+      assert self._Pri is None
+    self._Pri= Stim
 
  # Method HandleEvent enters the supplied stimulus in the default queue and
- # invokes the FSM interpreter to handle the stimulus.
-  def HandleEvent( self, Stim, Par=None ):
+ # invokes the FSM interpreter to handle the stimulus. If Trace is True and
+ # tracing is enabled, the trace of the (state,stimulus) history is returned,
+ # otherwise None is returned.
+  def HandleEvent( self, Stim, Par=None, Trace=False ):
     self.ReportEvent( Stim, Par )
-    return self._Interpret()
+    if Trace:
+      return self._InterpretTrace( self )
+    return self._Interpret( self )
 
  # Method GetState retrieves the current state and the last stimulus. Note that
  # the state will not change until the action associated with the aforementioned
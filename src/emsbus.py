@@ -29,8 +29,11 @@
 # - Include a version number, which is retrievable at run time.
 #
 import bfsm				# Basic finite state machine
+import collections			# Unbounded lock-free queue
 import ctypes				# Invoke C function
+import os				# Low level i/o
 import queue				# Inter thread communication
+import select				# Wait for i/o completion
 import serial				# Asynchronous serial i/o
 import syslog				# Syslog access
 import termios				# POSIX style tty control
@@ -56,10 +59,10 @@ EMS_Data  = 4
 # Define the 'ack' and 'nack' to be sent immediatly following a write request.
 # The reply codes defined below cannot be and are not used as device identifier.
 #
-EMS_Write_reply= (			# Write reply codes
+EMS_Write_reply= frozenset( (		# Write reply codes
   0x01,					# Succes
   0x04					# Failure
-)
+) )
 
 EMSBUS_Break_time= 0.002		# Break time, 19 bits @ 9600 [b/s]
 EMSBUS_Min_frame_size= 4		# Minimum frame size of RQ, RP or WQ,
@@ -70,10 +73,28 @@ EMSBUS_PolReq_Timeout= 0.200		# Poll request time out [s]
 EMSBUS_ReaReq_Timeout= 0.125		# Read request time out [s]
 EMSBUS_WriReq_Timeout= 0.125		# Write request time out [s]
 
+#
+# Define the time out of the watchdog timer to start upon entry of a state, and
+# the set of (state,stimulus) pairs upon which a watchdog timer is stopped, as
+# used by the state actions of the FSMs. As the names of the states and stimuli
+# are interned by module bfsm, each test reduces to a single hash lookup using
+# the cached hash value of the name and an identity test.
+#
+_IFSM_Wdt_timeout= { 'RxRq': EMSBUS_ReaReq_Timeout,	# Ingress FSM
+                     'XmRq': EMSBUS_ReaReq_Timeout,
+                     'RxWq': EMSBUS_WriReq_Timeout,
+                     'XmWq': EMSBUS_WriReq_Timeout }
+_EFSM_Wdt_timeout= { 'WiRp': EMSBUS_ReaReq_Timeout,	# Egress FSM, internal
+                     'WiWp': EMSBUS_WriReq_Timeout }
+_EFSM_Reply_events= frozenset( ( ('WiRp','rearep'), ('WiRpb','rearep'),
+                                 ('WiWp','wrirep'), ('WiWpb','wrirep') ) )
+
 #
 # Serial device parameter definitions.
 #
 SERIAL_Device= '/dev/ttyAMA0'		# PL011 UART device name on RPi
+SERIAL_Read_size= 4096			# Maximum number of octets per read, the
+					#   size of the tty input buffer
 # Define the special character codes used in the octet stream. Both a break and
 # a framing error are indicated with a three character string, which starts
 # with b'\xff\x00'. An octet with value b'\xff' as received on the serial port
@@ -101,6 +122,79 @@ EMSBUS_MODE_MONPART= 3			# Do both
 EMSBUS_MASK_MONITOR= 0x01		# Forward some or all ingress frames
 EMSBUS_MASK_EGRESS = 0x02		# Forward egress frames
 
+#
+# Class FrameRec defines the record of a frame passed between the threads of an
+# Emsbus instance: the frame itself, its type and, for an ingress frame, the
+# time of arrival of the first octet. Using slots, the record is smaller and
+# its fields are accessed faster than the keys of a dictionary. At the user
+# interface, method read_frame converts the record into a dictionary.
+#
+class FrameRec():
+  '''A frame with its meta information'''
+  __slots__= ( 'frame', 'type', 'time' )
+
+  def __init__( self, frame, type=None, time=None ):
+    self.frame= frame			# Frame, without the check-sum
+    self.type = type			# Type of frame, a stimulus of the FSMs
+    self.time = time			# Time of arrival of an ingress frame
+
+#
+# Define the type of a frame as far as it can be determined from a single octet,
+# that is from the octet of a one-octet frame and from the destination octet of
+# a longer frame. Each table is indexed by the value of that octet.
+#
+_ONE_OCTET_Type= tuple( 'polreq' if octet & 0x80 else
+                        'wrirep' if octet in EMS_Write_reply else
+                        'polrep' for octet in range(256) )
+_DESTIN_Type   = tuple( 'rearep' if octet == 0x00 else
+                        'reareq' if octet & 0x80 else
+                        'rporwq' for octet in range(256) )
+
+#
+# Class _Stats defines the save area of the EMS bus statistics. The counters are
+# attributes in slots, thus an increment of a counter stores the new value at a
+# fixed offset in the object rather than in a dictionary, and is faster than an
+# increment of a field of a ctypes structure. Method get_statistics of class
+# Emsbus returns the statistics as a dictionary.
+#
+class _Stats():
+  '''EMS bus statistics'''
+  __slots__= (
+    'bus_address_conflict',	# Total frames received from my address
+    'ingress_total_frames',	# Total ingress frame count
+    'ingress_total_octets',	# Total ingress octet count
+    'ingress_echo_frames',	# Total suppressed echos of egress frames
+    'ingress_empty_frames',	# Total ingress empty frame count
+    'ingress_short_frames',	# Total ingress short frame count
+    'ingress_errors',		# Total ingress erred octets
+    'ingress_err_frames',	# Total ingress erred frame count
+    'ingress_err_octets',	# Total ingress octets in erred frames
+    'ingress_err_timeout',	# Total ingress time outs
+    'ingress_err_protocol',	# Total ingress protocol errors
+    'ingress_emsplus_frames',	# Total ingress frames using EMS-plus format
+    'ingress_polreq_frames',	# Total ingress poll request frame count
+    'ingress_polrep_frames',	# Total ingress poll reply frame count
+    'ingress_reareq_frames',	# Total ingress read request frame count
+    'ingress_rearep_frames',	# Total ingress read reply frame count
+    'ingress_wrireq_frames',	# Total ingress write request frame count
+    'ingress_wrirep_frames',	# Total ingress write reply frame count
+    'egress_total_frames',	# Total egress frame count
+    'egress_total_octets',	# Total egress octet count
+    'egress_polrep_frames',	# Total egress poll reply frame count
+    'egress_reareq_frames',	# Total egress read request frame count
+    'egress_rearep_frames',	# Total egress read reply frame count
+    'egress_wrireq_frames',	# Total egress write request frame count
+    'egress_wrirep_frames',	# Total egress write reply frame count
+    'egress_err_short_frames',	# Total egress frames, too short
+    'egress_err_long_frames',	# Total egress frames, too long
+    'egress_err_timeout',	# Total egress time outs
+    'egress_err_protocol',	# Total egress protocol errors
+    'start_time'		# Start of collection of statistics
+  )
+
+  def __init__( self ):
+    for name in _Stats.__slots__:
+      setattr( self, name, 0 )
 
 class Emsbus():
   '''Driver to read frames from and sent frames onto the EMS bus'''
@@ -114,48 +208,98 @@ class Emsbus():
     self.device= device			# Save my EMS bus device id
     self.mode  = mode			# Save mode: monitor, participate or mixed
     self.name  = 'bus'			# Name to use in syslog messages
+  # Precompute the values derived from the device id, used for each frame.
+    self.device_poll  = device | 0x80	# My id in a poll or read request
+    self.device_dest  = frozenset( (0x00,device) )	# Destinations for me
+    self.device_polrep= bytes( [device] )	# My poll reply
+  #
+  # Build the decision tables and the state action vectors of the FSMs of the
+  # selected mode. The type of the actions is changed from 'function reference'
+  # to 'bound method reference'. Then the 'self' parameter will be added
+  # automatically, giving the action methods access to the instance variables.
+  # The tables of the class are not modified, thus the tables of the other modes
+  # are left alone and another instance finds them unchanged.
+  # Each action is bound only once, and the bound method is shared by all the
+  # entries referring to that action. The actions which do nothing are replaced
+  # by None, which the FSMs skip without a call.
+  # Note that the FSMs do not look up the transitions in these nested tables:
+  # the (state,stimulus) pairs are encoded once in a flat table per decision
+  # table, see module bfsm.
   #
-  # Change the type of the actions from 'function reference' to 'bound method
-  # reference'. Then the 'self' parameter will be added automatically, giving
-  # the action methods access to the instance variables.
+    self.fsmdt= {}			# Decision tables, bound actions
+    self.fsmsa= {}			# State action vectors, bound actions
+    bound= { None: None,		# Map action onto bound method
+             Emsbus.ifsm_do_nothing: None,
+             Emsbus.efsm_do_nothing: None }
+    for gress in Emsbus.FSMDT[self.mode]:
+      for action in Emsbus.FSMSA[self.mode][gress].values():
+        if action not in bound:
+          bound[action]= types.MethodType( action, self )
+      for row in Emsbus.FSMDT[self.mode][gress].values():
+        for (state,action) in row.values():
+          if action not in bound:
+            bound[action]= types.MethodType( action, self )
+      self.fsmdt[gress]= {
+        state: { stim: ( entry[0], bound[entry[1]] ) for stim,entry in row.items() }
+        for state,row in Emsbus.FSMDT[self.mode][gress].items() }
+      self.fsmsa[gress]= {
+        state: bound[action]
+        for state,action in Emsbus.FSMSA[self.mode][gress].items() }
   #
-    for mode in Emsbus.FSMDT:
-      for gress in Emsbus.FSMDT[mode]:
-        for state in Emsbus.FSMDT[mode][gress]:
-          for stim in Emsbus.FSMDT[mode][gress][state]:
-            Emsbus.FSMDT[mode][gress][state][stim]= (
-              Emsbus.FSMDT[mode][gress][state][stim][0],	# Do not change
-              types.MethodType(Emsbus.FSMDT[mode][gress][state][stim][1],self) )
   #
-    for mode in Emsbus.FSMSA:
-      for gress in Emsbus.FSMSA[mode]:
-        for state in Emsbus.FSMSA[mode][gress]:
-          if Emsbus.FSMSA[mode][gress][state] is None:
-            continue
-          Emsbus.FSMSA[mode][gress][state]= types.MethodType(Emsbus.FSMSA[mode][gress][state],self)
+  # Load the C versions of the check-sum calculation, of the removal of the
+  # escape sequences and of the paced transmission of a frame. If the shared
+  # library is not available, the (slower) Python versions in methods
+  # _calc_checksum, _handle_iframe and writer are used.
+  #
+    try:
+      clib= ctypes.CDLL( './emsbus_cksum.so', use_errno=True )
+    except OSError:
+      clib= None
+    if clib is None:
+      self._ccksum  = None
+      self._cunesc  = None
+      self._cpaced  = None
+    else:
+      self._ccksum  = clib.ems_cksum
+      self._ccksum.argtypes= ( ctypes.c_void_p, ctypes.c_size_t )
+      self._ccksum.restype = ctypes.c_uint8
+      self._cunesc  = clib.ems_unescape
+      self._cunesc.argtypes= ( ctypes.POINTER(ctypes.c_ubyte), ctypes.c_size_t,
+                               ctypes.POINTER(ctypes.c_int) )
+      self._cunesc.restype = ctypes.c_size_t
+      self._cpaced  = clib.ems_send_paced
+      self._cpaced.argtypes= ( ctypes.c_int, ctypes.c_char_p, ctypes.c_size_t,
+                               ctypes.c_long )
+      self._cpaced.restype = ctypes.c_int
+    self._cunesc_err= ctypes.c_int()	# Error count of ems_unescape
   #
     self.serial= None			# Serial port object instance
 
     self.reader_thread= None		# Ingress variables
     self.reader_alive = None
-    self.iframe       = bytearray()	# Assembled ingress frame
+    self.reader_wake  = None		# Pipe to wake up thread reader
+    self.iframe       = None		# Ingress frame being handled
+    self.iframe_buf   = bytearray( 2*EMSBUS_Max_frame_size + 8 )	# Assembly buffer
+    self.iframe_len   = 0		# Number of octets in assembly buffer
     self.iframe_error = 0		# Number of errors in current/last frame
-    self.iframe_queue = queue.Queue()	# Queue for frames read from bus
-    self.iframe_time  = None		# Time of arrival of first octet of frame
+    self.iframe_queue = collections.deque()	# Queue for frames read from bus
+    self.iframe_ready = threading.Event()	# Frame(s) available in iframe_queue
+    self.iframe_time  = None		# Time of arrival of first octet of frame,
+					#   wall clock, passed to the user
     self.iframe_type  = None		# Type of frame
 
     self.writer_thread= None		# Egress variables
     self.writer_alive = None
     self.eframe       = None
-    self.eframe_queue = queue.Queue()	# Queue for frames to be written to bus
-    self.eframe_time  = None
+    self.eframe_queue = collections.deque()	# Queue for frames to be written to bus
+    self.eframe_ready = threading.Event()	# Frame(s) available in eframe_queue
 
     self.idisp_thread = None		# Ingress dispatcher variables
     self.idisp_alive  = None
     self.idisp_queue  = queue.Queue()
     self.idisp_frame  = None
-    self.idisp_fsm    = bfsm.Bfsm( Emsbus.FSMDT[self.mode]['ingress'],
-                                   Emsbus.FSMSA[self.mode]['ingress'] )
+    self.idisp_fsm    = bfsm.Bfsm( self.fsmdt['ingress'], self.fsmsa['ingress'] )
     self.idisp_fsm_wdt= watchdog.WatchdogTimer()
     self.idisp_log    = None		# Call back for logging a frame
     self.idisp_log_slf= None		# Object instance to be used for logging
@@ -163,46 +307,15 @@ class Emsbus():
     self.edisp_thread = None		# Egress dispatcher variables
     self.edisp_alive  = None
     self.edisp_queue  = queue.Queue()	# Input from user application
-    self.edisp_buffer = queue.Queue()	# Buffer area, frames awaiting transmission
+    self.edisp_buffer = collections.deque()	# Buffer area, frames awaiting transmission
     self.edisp_frame  = bytearray()
     self.edisp_type   = None
-    self.edisp_fsm    = bfsm.Bfsm( Emsbus.FSMDT[self.mode]['egress'],
-                                   Emsbus.FSMSA[self.mode]['egress'] )
+    self.edisp_fsm    = bfsm.Bfsm( self.fsmdt['egress'], self.fsmsa['egress'] )
     self.edisp_fsm_wdt= watchdog.WatchdogTimer()
 
   # Preset the SME-bus statistics.
-    self.sbs= dict(			# Define EMS bus statistics save area
-      bus_address_conflict  = 0,	# Total frames received from my address
-      ingress_total_frames  = 0,	# Total ingress frame count
-      ingress_total_octets  = 0,	# Total ingress octet count
-      ingress_echo_frames   = 0,	# Total suppressed echos of egress frames
-      ingress_empty_frames  = 0,	# Total ingress empty frame count
-      ingress_short_frames  = 0,	# Total ingress short frame count
-      ingress_errors        = 0,	# Total ingress erred octets
-      ingress_err_frames    = 0,	# Total ingress erred frame count
-      ingress_err_octets    = 0,	# Total ingress octets in erred frames
-      ingress_err_timeout   = 0,	# Total ingress time outs
-      ingress_err_protocol  = 0,	# Total ingress protocol errors
-      ingress_emsplus_frames= 0,	# Total ingress frames using EMS-plus format
-      ingress_polreq_frames = 0,	# Total ingress poll request frame count
-      ingress_polrep_frames = 0,	# Total ingress poll reply frame count
-      ingress_reareq_frames = 0,	# Total ingress read request frame count
-      ingress_rearep_frames = 0,	# Total ingress read reply frame count
-      ingress_wrireq_frames = 0,	# Total ingress write request frame count
-      ingress_wrirep_frames = 0,	# Total ingress write reply frame count
-      egress_total_frames   = 0,	# Total egress frame count
-      egress_total_octets   = 0,	# Total egress octet count
-      egress_polrep_frames  = 0,	# Total egress poll reply frame count
-      egress_reareq_frames  = 0,	# Total egress read request frame count
-      egress_rearep_frames  = 0,	# Total egress read reply frame count
-      egress_wrireq_frames  = 0,	# Total egress write request frame count
-      egress_wrirep_frames  = 0,	# Total egress write reply frame count
-      egress_err_short_frames= 0,	# Total egress frames, too short
-      egress_err_long_frames= 0,	# Total egress frames, too long
-      egress_err_timeout    = 0,	# Total egress time outs
-      egress_err_protocol   = 0,	# Total egress protocol errors
-      start_time = time.time()		# Start of collection of statistics
-    )
+    self.sbs= _Stats()			# Define EMS bus statistics save area
+    self.sbs.start_time= time.time()	# Start of collection of statistics
 
  #
  # Finite State Machine methods.
@@ -213,14 +326,13 @@ class Emsbus():
  # fsm).
  #
   def ifsa_handle_timeout( self ):	# Time out call back
-    self.sbs['ingress_err_timeout']+= 1
+    self.sbs.ingress_err_timeout+= 1
     self.idisp_fsm.HandleEvent( 'timout' )
 
   def ifsa_start_wdt( self ):		# State action, set watch dog timer
-    if   self.idisp_fsm.NxtState in ('RxRq','XmRq'):
-      self.idisp_fsm_wdt.start( EMSBUS_ReaReq_Timeout, self.ifsa_handle_timeout )
-    elif self.idisp_fsm.NxtState in ('RxWq','XmWq'):
-      self.idisp_fsm_wdt.start( EMSBUS_WriReq_Timeout, self.ifsa_handle_timeout )
+    timeout= _IFSM_Wdt_timeout.get( self.idisp_fsm.NxtState )
+    if timeout is not None:
+      self.idisp_fsm_wdt.start( timeout, self.ifsa_handle_timeout )
     return True				# No change in event queue
 
   def ifsa_stop_wdt( self ):		# State action, stop watch dog timer
@@ -236,7 +348,7 @@ class Emsbus():
  # to the EMS-bus. Stop this entity from sending data onto the EMS-bus. (Fall
  # back to monitor mode?)
   def ifsm_check_polrep( self ):	# Check the polrep
-    if self.idisp_frame['Frame'][0] != self.device:
+    if self.idisp_frame.frame[0] != self.device:
       self.idisp_frame= None		# Ignore frame
       return
     pass				# Do something dreadfull
@@ -245,21 +357,21 @@ class Emsbus():
     pass
 
   def ifsm_do_rearep( self ):		# Change frame type to ReadReply
-    self.idisp_frame['Type']= 'rearep'
+    self.idisp_frame.type= 'rearep'
     self.idisp_fsm.AugmentEvent( 'rearep' )
-    self.sbs['ingress_rearep_frames']+= 1
+    self.sbs.ingress_rearep_frames+= 1
 
   def ifsm_do_wrireq( self ):		# Change frame type to WriteRequest
-    self.idisp_frame['Type']= 'wrireq'
+    self.idisp_frame.type= 'wrireq'
     self.idisp_fsm.AugmentEvent( 'wrireq' )
-    self.sbs['ingress_wrireq_frames']+= 1
+    self.sbs.ingress_wrireq_frames+= 1
 
   def ifsm_forward_frame( self ):	# Forward frame to 'output' queue
     self.idisp_queue.put( self.idisp_frame )
     self.idisp_frame= None
 
   def ifsm_handle_rearep( self ):	# Report error if not a broadcast
-    if self.idisp_frame['Frame'][EMS_Destin] != 0:
+    if self.idisp_frame.frame[EMS_Destin] != 0:
       self.ifsm_report_error()
     self.ifsm_forward_frame()
 
@@ -267,25 +379,25 @@ class Emsbus():
     self.idisp_frame= None		# Clear reference to frame
 
   def ifsm_passon_polreq( self ):	# Pass on a polreq to egress_dispatcher
-    if self.idisp_frame['Frame'][0] == self.device | 0x80:
+    if self.idisp_frame.frame[0] == self.device_poll:
       self.edisp_queue.put( 'PQ' )	# Inform egress_dispatcher
     self.idisp_frame= None		# forget frame
 
   def ifsm_passon_rearep( self ):	# Pass on a rearep
-    if self.idisp_frame['Frame'][EMS_Destin] in (0x00,self.device):
+    if self.idisp_frame.frame[EMS_Destin] in self.device_dest:
       self.ifsm_forward_frame()		# Pass on request to user application
     else:
       self.ifsm_ignore_frame()
 
   def ifsm_passon_reareq( self ):	# Pass on a reareq
-    if self.idisp_frame['Frame'][EMS_Destin] != self.device | 0x80:
+    if self.idisp_frame.frame[EMS_Destin] != self.device_poll:
       self.idisp_frame= None		# Forget frame
       return
     self.edisp_queue.put( 'RQ' )	# Notify egress_dispatcher
     self.ifsm_forward_frame()		# Pass on request to user application
 
   def ifsm_passon_wrireq( self ):	# Pass on a wrireq
-    if self.idisp_frame['Frame'][EMS_Destin] != self.device:
+    if self.idisp_frame.frame[EMS_Destin] != self.device:
       self.idisp_frame= None
       return
     self.edisp_queue.put( 'WQ' )	# Notify egress_dispatcher
@@ -293,8 +405,8 @@ class Emsbus():
 
   def ifsm_report_error( self ):	# Report a protocol error
     (state,stim)= self.idisp_fsm.GetState()
-    self._log_message( "Error, idisp recieved {0} in state {1}".format(stim,state) )
-    self.sbs['ingress_err_protocol']+= 1
+    self._log_message( "Error, idisp recieved {0} in state {1}", stim, state )
+    self.sbs.ingress_err_protocol+= 1
 
   def ifsm_reppe_and_forf( self ):	# REPort Protocol Error, FORward Frame
     self.ifsm_report_error()
@@ -305,9 +417,9 @@ class Emsbus():
     self.ifsm_ignore_frame()
 
   def ifsm_reprxd_and_forf( self ):	# REPort Read eXchange Done, FORward Frame
-    if   self.idisp_frame['Frame'][EMS_Destin] == self.device:
+    if   self.idisp_frame.frame[EMS_Destin] == self.device:
       self.ifsm_repwxd_and_forf()
-#   elif self.idisp_frame['Frame'][EMS_Destin] == 0x00:
+#   elif self.idisp_frame.frame[EMS_Destin] == 0x00:
 #     self.ifsm_forward_frame()		# Pass on request to user application
     else:
       self.idisp_frame= None
@@ -318,7 +430,7 @@ class Emsbus():
 
 
   def efsa_handle_timeout( self ):	# Time out call back
-    self.sbs['egress_err_timeout']+= 1
+    self.sbs.egress_err_timeout+= 1
     self.edisp_fsm.HandleEvent( 'timout' )
 
   def efsa_start_wdt_er( self ):	# State action, set watch dog timer
@@ -333,24 +445,21 @@ class Emsbus():
     return True				# No change in event queue
 
   def efsa_start_wdt_ir( self ):	# State action, set watch dog timer
-    if   self.edisp_fsm.NxtState == 'WiRp':
-      self.edisp_fsm_wdt.start( EMSBUS_ReaReq_Timeout, self.efsa_handle_timeout )
-    elif self.edisp_fsm.NxtState == 'WiWp':
-      self.edisp_fsm_wdt.start( EMSBUS_WriReq_Timeout, self.efsa_handle_timeout )
+    timeout= _EFSM_Wdt_timeout.get( self.edisp_fsm.NxtState )
+    if timeout is not None:
+      self.edisp_fsm_wdt.start( timeout, self.efsa_handle_timeout )
     return True				# No change in event queue
 
   def efsa_stop_wdt_ir( self ):		#  State action, stop watch dog timer
     cs= (self.edisp_fsm.State,self.edisp_fsm.Stimulus)
-    if cs in ( ('WiRp','rearep'), ('WiRpb','rearep') ):
-      self.edisp_fsm_wdt.stop()
-    if cs in ( ('WiWp','wrirep'), ('WiWpb','wrirep') ):
+    if cs in _EFSM_Reply_events:
       self.edisp_fsm_wdt.stop()
     return True				# No change in event queue
 
 
   def efsm_buffer_frame( self ):	# Buffer frame temporarily
-    qv= { 'Frame': self.edisp_frame, 'Type': self.edisp_frame_type }
-    self.edisp_buffer.put( qv )
+    qv= FrameRec( self.edisp_frame, self.edisp_frame_type )
+    self.edisp_buffer.append( qv )
     self.edisp_frame= None
 
   def efsm_do_nothing( self ):		# Do nothing
@@ -365,16 +474,16 @@ class Emsbus():
     self.edisp_fsm.AugmentEvent( 'wrireq' )
 
   def efsm_forward_frame( self ):	# Forward recieved frame
-    qv= { 'Frame': self.edisp_frame, 'Type': self.edisp_frame_type }
-    self.eframe_queue.put( qv )
+    qv= FrameRec( self.edisp_frame, self.edisp_frame_type )
+    self._queue_eframe( qv )
     self.edisp_frame= None
 
   def efsm_forward_buffer( self ):	# Forward buffered frame
-    qv= self.edisp_buffer.get()
-    self.eframe_queue.put( qv )
+    qv= self.edisp_buffer.popleft()
+    self._queue_eframe( qv )
 
   def efsm_handle_poll( self ):		# Handle a polreq
-    if not self.edisp_buffer.empty():
+    if self.edisp_buffer:
       pass
     self.efsm_send_polrep()		# Push polrep
 
@@ -383,17 +492,17 @@ class Emsbus():
 
   def efsm_report_error( self ):	# Report a protocol error
     (state,stim)= self.edisp_fsm.GetState()
-    self._log_message( "Error, edisp recieved {0} in state {1}".format(stim,state) )
-    self.sbs['egress_err_protocol']+= 1
+    self._log_message( "Error, edisp recieved {0} in state {1}", stim, state )
+    self.sbs.egress_err_protocol+= 1
 
   def efsm_reppe_and_ignf( self ):	# REPort Protocol Error, IGNore Frame
     self.efsm_report_error()
     self.edisp_frame= None
 
   def efsm_send_polrep( self ):		# Send a poll reply
-    qv= { 'Frame': bytes([self.device]), 'Type': 'polrep' }
-    self.eframe_queue.put( qv )		# Push polrep
-    if self.edisp_buffer.empty():
+    qv= FrameRec( self.device_polrep, 'polrep' )
+    self._queue_eframe( qv )		# Push polrep
+    if not self.edisp_buffer:
       self.edisp_fsm.AugmentEvent( 'bufemp' )
 
 
@@ -643,20 +752,47 @@ class Emsbus():
  # referred to as a CRC. However, it is not a CRC! The algorithm is taken from
  # URL https://github.com/danimaciasperea/Calduino.
  #
-  def _calc_checksum( self, bfr ):
-    mask= 0x0c				# Checksum mask
+ # The calculation is preferably done by the C function in emsbus_cksum.so. The
+ # Python version below is used if that library could not be loaded. Buffer bfr
+ # is either a bytes object or a writable buffer, such as a bytearray, of which
+ # the first n octets, by default all octets, contain the frame including the
+ # octet for the check-sum. The C function is passed a bytes object as is, and
+ # a writable buffer wrapped into a ctypes array, which shares the memory of the
+ # buffer. Thus the frame is not copied, although for a frame of at most 34
+ # octets the wrapper takes about 0.4 [us] more than a copy would. The Python
+ # version loops over a slice of the buffer, which is faster than a loop over a
+ # memoryview.
+ #
+ # The update of the check-sum with one octet consists of a shift, which depends
+ # only on the current value of the check-sum, followed by an exclusive-or with
+ # the octet. The result of the shift is precomputed for all 256 values of the
+ # check-sum in table _CKSUM_TBL, using checksum mask 0x0c. The table is a
+ # tuple rather than a bytes object: both return the entries as (small) ints
+ # without a conversion, but indexing a tuple is faster. In Python 3.11 the loop
+ # below takes about 20% less time using a tuple.
+ #
+  _CKSUM_TBL= tuple( (((c^0x0c) << 1) | 0x01 if c & 0x80 else c << 1) & 0xff
+                     for c in range(256) )
+
+  def _calc_checksum( self, bfr, n=None ):
     chks= 0x00				# Checksum preset
-    if len(bfr) < 2:
+    if n is None:
+      n= len( bfr )
+    if n < 2:
       raise ValueError( "Frame too short for check-sum calculation" )
+    if self._ccksum is not None:
+      if type(bfr) is not bytes:
+        bfr= (ctypes.c_ubyte*n).from_buffer( bfr )
+      return self._ccksum( bfr, n-1 )
 
-    for i in range( len(bfr)-1 ):
-      chks = ((chks^mask) << 1) | 0x01  if chks & 0x80  else chks << 1
-      chks^= bfr[i]
+    tbl= Emsbus._CKSUM_TBL
+    for octet in bfr[:n-1]:
+      chks= tbl[chks] ^ octet
 
-    return chks & 0xff
+    return chks
 
   def _flush_iframe( self ):
-    self.iframe= bytearray()
+    self.iframe_len  = 0		# Reuse assembly buffer
     self.iframe_error= 0
     self.iframe_time = None
 
@@ -677,39 +813,87 @@ class Emsbus():
  # ingress dispatcher can reset it's state in such a case.
  #
   def _handle_iframe( self ):
+  #
+  # The assembled frame is handled in the assembly buffer, which is reused for
+  # the next frame. A frame which is passed on is copied once, when it is
+  # queued. An erred frame is only copied if it is passed to the logger. If the
+  # C library is not available, the check-sum calculation copies the frame too.
+  # The buffer, the length of the frame and the statistics are kept in local
+  # variables.
+  #
+    buf= self.iframe_buf
+    n  = self.iframe_len
+    sbs= self.sbs
+
   #
   # Do character handling: remove the framing error indicators and replace the
-  # escaped 0xff characters by their original value.
+  # escaped 0xff characters by their original value. Nothing needs to be done if
+  # the frame does not contain an escape octet, which is the common case. If
+  # the C version is available, the frame is handled in place.
+  # Otherwise the frame is split at each escape octet. The first octet of the part
+  # following an escape octet tells how to handle that escape: an empty part
+  # means an escaped 0xff, which is restored, and a part starting with 0x00 is a
+  # framing error indicator, which is removed but leaves the erred octet. Any
+  # other octet following an escape octet is passed on unchanged, as is a
+  # framing error indicator at the end of the frame. The frame is rebuilt with a
+  # single join, and moved back into the assembly buffer. Both versions are
+  # linear in the length of the frame. The in-place compaction with a read and a
+  # write offset, as done in C, is not used in Python: the loop over the octets
+  # is more than twice as slow as the split and join.
   #
     self.iframe_error= 0
-    octpos= self.iframe.find( SERIAL_Escape )
-    while octpos >= 0:
-      octpos+= 1
-      if octpos >= len(self.iframe):
-        break
-      if   self.iframe[octpos] == SERIAL_Escape:
-        if octpos+1 < len(self.iframe):
-          self.iframe= self.iframe[:octpos] + self.iframe[octpos+1:]
-        else:
-          self.iframe= self.iframe[:octpos]
-          break
-      elif self.iframe[octpos] == SERIAL_FrmErr:
-        if octpos+1 < len(self.iframe):
-          self.iframe= self.iframe[:octpos-1] + self.iframe[octpos+1:]
-          self.iframe_error+= 1
-      octpos= self.iframe.find( SERIAL_Escape, octpos )
+    if buf.find( SERIAL_Escape, 0, n ) < 0:
+      pass				# No escape octets
+    elif self._cunesc is not None:
+      n= self._cunesc( (ctypes.c_ubyte*n).from_buffer(buf), n,
+                       ctypes.byref(self._cunesc_err) )
+      self.iframe_error= self._cunesc_err.value
+    else:
+      parts= buf[:n].split( b'\xff' )
+      frame= [ parts[0] ]
+      i= 1
+      m= len(parts)
+      while i < m:
+        part= parts[i]
+        if   not part:			# Escaped 0xff or 0xff at end of frame
+          frame.append( b'\xff' )
+          if i+1 < m:
+            i+= 1
+            frame.append( parts[i] )	# Part following the escaped 0xff
+        elif part[0] == SERIAL_FrmErr:
+          if   len(part) > 1:		# Remove framing error indicator
+            frame.append( part[1:] )
+            self.iframe_error+= 1
+          elif i+1 < m:			# Erred octet is 0xff
+            i+= 1
+            frame.append( b'\xff' )
+            frame.append( parts[i] )
+            self.iframe_error+= 1
+          else:				# Indicator at end of frame
+            frame.append( b'\xff\x00' )
+        else:				# Unescaped 0xff
+          frame.append( b'\xff' )
+          frame.append( part )
+        i+= 1
+      frame= b''.join( frame )
+      n= len( frame )
+      buf[:n]= frame			# Same size, thus no resize
+    self.iframe_len= n
 
   #
   # In case an echo of our own transmission (sent by method writer) is received,
   # ignore the frame and do not update the (ingress) statistics. This frame is
   # already accounted for in the egress path.
   # To do: check the time of arrival against the time of transmission.
+  # Note: the lengths of the frames are compared first, and only if they are
+  # equal the octets are compared by startswith, using memcmp(). A hash of the
+  # frames would need a pass over all octets of each frame.
   #
     if self.eframe is not None:
-      if self.iframe == self.eframe:
+      if n == len( self.eframe )  and  buf.startswith( self.eframe ):
         self.eframe= None		# Match only once
         self._flush_iframe()
-        self.sbs['ingress_echo_frames']+= 1
+        sbs.ingress_echo_frames+= 1
         return				# Ignore frame
 #     elif len(self.eframe) > EMSBUS_Min_frame_size  and  len(self.iframe) == len(self.eframe):
 #       if self.iframe[-1] != self._calc_checksum( self.iframe ):
@@ -717,24 +901,24 @@ class Emsbus():
 #         self._flush_iframe()
 #         return			# Ignore frame
 
-    self.sbs['ingress_total_frames']+= 1
-    self.sbs['ingress_total_octets']+= len(self.iframe) + 1
+    sbs.ingress_total_frames+= 1
+    sbs.ingress_total_octets+= n + 1
 
   #
   # If an error was found in (at least) one of the octets, update the error
   # counters, reset the error flag and forget about this frame.
   #
     if self.iframe_error > 0:
-      self.sbs['ingress_err_frames']+= 1
-      self.sbs['ingress_err_octets']+= len(self.iframe) + 1
-      self.sbs['ingress_errors'    ]+= self.iframe_error
+      sbs.ingress_err_frames+= 1
+      sbs.ingress_err_octets+= n + 1
+      sbs.ingress_errors+= self.iframe_error
       self.iframe= b'ERR'
       self._queue_iframe()
 #     self._flush_iframe()
       return				# Ignore erred frame
 
-    if len(self.iframe) == 0:
-      self.sbs['ingress_empty_frames']+= 1
+    if n == 0:
+      sbs.ingress_empty_frames+= 1
       self._flush_iframe()
       return				# Ignore empty frame
 
@@ -742,42 +926,53 @@ class Emsbus():
   # Handle a frame of one octet. It can be be either a poll request, a poll
   # reply or a write reply.
   #
-    elif len(self.iframe) == 1:
+    elif n == 1:
+      self.iframe= buf[:1]
       self._queue_iframe()
 
-    elif len(self.iframe) <= EMSBUS_Min_frame_size:
+    elif n <= EMSBUS_Min_frame_size:
       if self.idisp_log is not None:
         self.idisp_log( self.idisp_log_slf, self.iframe_time,
-                        self.iframe, None )
-      self.sbs['ingress_short_frames']+= 1
+                        buf[:n], None )
+      sbs.ingress_short_frames+= 1
       self.iframe= b'ERR'
       self._queue_iframe()
  #    self._flush_iframe()
 
   #
   # Handle a 'normal' frame, that is a read request, a read reply or a write
-  # request. A frame with a check-sum error is counted and ignored.
+  # request. A frame with a check-sum error is counted and ignored. The
+  # check-sum is computed once, in the buffer, and is passed to the logger in
+  # case of an error. A correct frame is copied without its check-sum.
   #
-    elif self.iframe[-1] == self._calc_checksum( self.iframe ):
-      if self.iframe[2] >= 0xf0:	# Check type field
-        self.sbs['ingress_emsplus_frames']+= 1
-      del self.iframe[-1]		# Remove checksum
-      self._queue_iframe()
     else:
-      if self.idisp_log is not None:
-        self.idisp_log( self.idisp_log_slf, self.iframe_time,
-                        self.iframe, self._calc_checksum(self.iframe) )
-      self.sbs['ingress_err_frames']+= 1
-      self.sbs['ingress_err_octets']+= len(self.iframe) + 1
-      self.iframe= b'ERR'
-      self._queue_iframe()
+      cs= self._calc_checksum( buf, n )
+      if buf[n-1] == cs:
+        if buf[2] >= 0xf0:		# Check type field
+          sbs.ingress_emsplus_frames+= 1
+        self.iframe= buf[:n-1]		# Copy frame, without checksum
+        self._queue_iframe()
+      else:
+        if self.idisp_log is not None:
+          self.idisp_log( self.idisp_log_slf, self.iframe_time, buf[:n], cs )
+        sbs.ingress_err_frames+= 1
+        sbs.ingress_err_octets+= n + 1
+        self.iframe= b'ERR'
+        self._queue_iframe()
 #     self._flush_iframe()
     return
 
  #
- # Private method _log_message writes a message to a syslog file.
+ # Private method _log_message writes a message to a syslog file. If arguments
+ # are supplied, the message is a format string which is formatted using those
+ # arguments. Formatting is skipped, like the message itself, if the priority of
+ # the message is masked by the syslog mask of the process.
  #
-  def _log_message( self, Msg ):
+  def _log_message( self, Msg, *Args ):
+    if not syslog.setlogmask(0) & syslog.LOG_MASK(syslog.LOG_INFO):
+      return				# Message is masked
+    if Args:
+      Msg= Msg.format( *Args )
     syslog.openlog( 'EMS', 0, syslog.LOG_LOCAL6 )
     syslog.syslog ( ' '.join( (self.name,Msg) ) )
     syslog.closelog()
@@ -787,10 +982,32 @@ class Emsbus():
  # local to this object.
  #
   def _queue_iframe( self ):
-    qv= { 'Frame': self.iframe, 'Time': self.iframe_time }
-    self.iframe_queue.put( qv )
+    qv= FrameRec( self.iframe, None, self.iframe_time )
+    self.iframe_queue.append( qv )
+    self.iframe_ready.set()
     self._flush_iframe()
 
+ #
+ # Private method _queue_eframe appends a frame to the queue of frames to be sent
+ # by thread writer.
+ #
+ # Queues iframe_queue and eframe_queue are deques, of which methods append and
+ # popleft are atomic, rather than instances of queue.Queue, which takes a lock
+ # and notifies a condition for each put and each get. An event is set after
+ # each append to wake up the consumer. The consumer clears the event before it
+ # retries to fetch an entry, thus no wake up is lost.
+ # Unlike thread reader, which waits in epoll for both the serial port and
+ # its wake up pipe, the consumers of these queues wait for a single source.
+ # Thus a pipe or an eventfd would not combine any waits, and would only add a
+ # write and a read system call per frame.
+ # Queue edisp_buffer is only used by the egress dispatcher, thus it is a plain
+ # deque. Queues idisp_queue and edisp_queue remain instances of queue.Queue:
+ # they have more than one producer, and the user application blocks on them.
+ #
+  def _queue_eframe( self, qv ):
+    self.eframe_queue.append( qv )
+    self.eframe_ready.set()
+
  #
  # Private method _start_threads starts four threads. The order is significant,
  # as the ingress dispatcher should be started before the reader, and the writer
@@ -805,6 +1022,7 @@ class Emsbus():
    # Start the thread which assembles frames from the octets received on the
    # serial port.
     self.reader_alive = True
+    self.reader_wake  = os.pipe()
     self.reader_thread= threading.Thread( target=self.reader, name='rx' )
     self.reader_thread.start()
 
@@ -822,6 +1040,10 @@ class Emsbus():
  #
  # Private method _stop_threads stops the threads in the reverse order of
  # activation. It will wait for a clean exit of the threads.
+ # Each thread checks its own flag, thus the threads stop one by one. A thread
+ # waiting for an event is woken up by setting that event, without passing a
+ # sentinel through its queue. Only the egress dispatcher, which waits in
+ # edisp_queue.get(), needs a sentinel. It is None, which is ignored.
  #
   def _stop_threads( self ):
   # Stop thread egress_dispatcher.
@@ -833,20 +1055,22 @@ class Emsbus():
   # Stop thread writer.
     self.writer_alive= False
     if self.writer_thread.is_alive():
-      self.eframe_queue.put( None )
+      self.eframe_ready.set()		# Wake up writer
       self.writer_thread.join()
 
    # Stop thread reader.
     self.reader_alive= False
     if self.reader_thread.is_alive():
-      if hasattr( self.serial, 'cancel_read' ):
-        self.serial.cancel_read()
+      os.write( self.reader_wake[1], b'\x00' )	# Wake up thread reader
       self.reader_thread.join()
+    os.close( self.reader_wake[0] )
+    os.close( self.reader_wake[1] )
 
    # Stop thread ingress_dispatcher.
     self.idisp_alive= False
     if self.idisp_thread.is_alive():
       self.idisp_queue.put( None )
+      self.iframe_ready.set()		# Wake up ingress_dispatcher
       self.idisp_thread.join()
 
    # Empty the internal queues.
@@ -855,11 +1079,13 @@ class Emsbus():
  # Public methods.
  # ---------------
  #
- # Method close reverses the operations of method open.
+ # Method close reverses the operations of method open. The threads are stopped
+ # before the serial port is closed, thus threads reader and writer do not use
+ # a closed descriptor.
  #
   def close( self ):
-    self.serial.close()			# Close serial port
     self._stop_threads()		# Stop all threads
+    self.serial.close()			# Close serial port
 
   def get_mode( self ):
     mode= [ 'Null', 'Monitor', 'Participate', 'Participate & monitor' ]
@@ -869,7 +1095,7 @@ class Emsbus():
  # Method get_statistics returns the collected statistics.
  #
   def get_statistics( self ):
-    return self.sbs.copy()		# Return a copy of the statistics
+    return { name: getattr(self.sbs,name) for name in _Stats.__slots__ }
 
  #
  # Method log_erred_frames accepts the object instance and a call-back method of
@@ -893,7 +1119,7 @@ class Emsbus():
     try:
       self.serial= serial.Serial( port = SERIAL_Device )
     except serial.SerialException as e:
-      self._log_message( "Could not open port {}: {}".format(self.serial.name,e) )
+      self._log_message( "Could not open port {}: {}", SERIAL_Device, e )
       self.serial= None
       return None
 
@@ -907,11 +1133,14 @@ class Emsbus():
 
  #
  # Method read_frame waits until a frame is put onto the internal queue, and
- # passes this frame to the caller.
+ # passes this frame to the caller. A frame is passed as a dictionary with keys
+ # 'Frame', 'Time' and 'Type'.
  #
   def read_frame( self ):
     qv= self.idisp_queue.get()
 #   self.idisp_queue.task_done()
+    if isinstance( qv, FrameRec ):
+      qv= { 'Frame': qv.frame, 'Time': qv.time, 'Type': qv.type }
     return qv
 
  #
@@ -926,6 +1155,8 @@ class Emsbus():
   def egress_dispatcher( self ):
     while self.edisp_alive:
       frame= self.edisp_queue.get()
+      if frame is None:			# Sentinel, sent upon stop
+        continue
       lf   = len(frame)
       type = None
       if   lf == 1:
@@ -935,22 +1166,17 @@ class Emsbus():
         type= 'rcv' + frame.lower()
 #       frame= None			# Ignore 'frame'
       elif lf < EMSBUS_Min_frame_size:
-        self.sbs['egress_total_frames']    += 1
-        self.sbs['egress_total_octets']    += lf + 1
-        self.sbs['egress_err_short_frames']+= 1
+        self.sbs.egress_total_frames    += 1
+        self.sbs.egress_total_octets    += lf + 1
+        self.sbs.egress_err_short_frames+= 1
 #       frame= None
       elif lf > EMSBUS_Max_frame_size:
-        self.sbs['egress_total_frames']   += 1
-        self.sbs['egress_total_octets']   += lf + 1
-        self.sbs['egress_err_long_frames']+= 1
+        self.sbs.egress_total_frames   += 1
+        self.sbs.egress_total_octets   += lf + 1
+        self.sbs.egress_err_long_frames+= 1
 #       frame= None
-      else:
-        if   frame[EMS_Destin] == 0x00:		# Certainly a read reply
-          type= 'rearep'
-        elif frame[EMS_Destin]  & 0x80:		# A read request
-          type= 'reareq'
-        else:
-          type= 'rporwq'			# A write request
+      else:				# Read reply, read request or write request
+        type= _DESTIN_Type[frame[EMS_Destin]]
 
       if type is not None:
         self.edisp_frame= frame
@@ -966,45 +1192,49 @@ class Emsbus():
  #
   def ingress_dispatcher( self ):
     while self.idisp_alive:
-      qv= self.iframe_queue.get()
-      frame= qv['Frame']
+      try:
+        qv= self.iframe_queue.popleft()
+      except IndexError:		# Queue is empty
+        self.iframe_ready.wait()
+        self.iframe_ready.clear()
+        continue
+      frame= qv.frame
   #
   # Try to determine the type of frame.
   # As a read_reply cannot be distinguished from a write_request at this time,
   # the distinction between the two is handled by the FSM, which has the context
   # information to make that decision.
+  # The type of a one-octet frame and of a regular frame is looked up in a table,
+  # indexed by the octet which determines the type. The frame counter of that
+  # type is incremented directly.
   #
-      if len(frame) == 1:
-        if frame[0] & 0x80:			# A poll request
-          qv['Type']= 'polreq'
-          self.sbs['ingress_polreq_frames']+= 1
-        elif frame[0] in EMS_Write_reply:	# A write reply
-          qv['Type']= 'wrirep'
-          self.sbs['ingress_wrirep_frames']+= 1
-        else:					# A poll reply
-          qv['Type']= 'polrep'
-          self.sbs['ingress_polrep_frames']+= 1
+      if len(frame) == 1:			# Poll request, poll reply or write reply
+        type= _ONE_OCTET_Type[frame[0]]
+        if   type == 'polreq':
+          self.sbs.ingress_polreq_frames+= 1
+        elif type == 'wrirep':
+          self.sbs.ingress_wrirep_frames+= 1
+        else:
+          self.sbs.ingress_polrep_frames+= 1
           if self.mode != EMSBUS_MODE_MONITOR:
             if frame[0] == self.device:
-              self.sbs['bus_address_conflict']+= 1
+              self.sbs.bus_address_conflict+= 1
       elif len(frame) == 2:			# Signals from egress_dispatcher
-        qv['Type']= 'xmt' + frame.lower()
+        type= 'xmt' + frame.lower()
       elif frame == b'ERR':
-        qv['Type']= 'errfrm'			# A frame with error(s)
-      else:
-        if   frame[EMS_Destin] == 0x00:		# A read reply (broadcast)
-          qv['Type']= 'rearep'
-          self.sbs['ingress_rearep_frames']+= 1
-        elif frame[EMS_Destin]  & 0x80:		# A read request
-          qv['Type']= 'reareq'
-          self.sbs['ingress_reareq_frames']+= 1
-        else:					# A read reply or write request
-          qv['Type']= 'rporwq'
+        type= 'errfrm'			# A frame with error(s)
+      else:				# Read reply, read request or write request
+        type= _DESTIN_Type[frame[EMS_Destin]]
+        if   type == 'rearep':
+          self.sbs.ingress_rearep_frames+= 1
+        elif type == 'reareq':
+          self.sbs.ingress_reareq_frames+= 1
+      qv.type= type
   #
   # Send the frame to the ingress Finite State Machine (FSM).
   #
       self.idisp_frame= qv			# Save frame and meta info
-      self.idisp_fsm.HandleEvent( qv['Type'] )	# Invoke FSM
+      self.idisp_fsm.HandleEvent( qv.type )	# Invoke FSM
 #     self.iframe_queue.task_done()		# Signal completion frame handling
 
  #
@@ -1020,51 +1250,100 @@ class Emsbus():
  # escape octets directly preceeding the BREAK indicator show the difference
  # between octet stream resembling the BREAK indicator and a real one. In the
  # latter case the number of preceeding escape octets is even.
+ #
+ # The octets of a frame are collected in a buffer which is allocated once, and
+ # which is reused for each frame. Its size allows for escaped octets in a frame
+ # of maximum size, but the buffer is extended if a (erred) frame does not fit.
+ # Variable iframe_len contains the number of octets in the buffer. The octets
+ # read are tracked by an offset and moved into the buffer via a memoryview,
+ # thus the data read is not sliced into new objects at each BREAK. Each read
+ # still allocates the bytes object returned by os.read, and each frame which is
+ # passed on is copied once, by method _handle_iframe, when it is queued. The
+ # check-sum is computed in the buffer, unless the C library is not available:
+ # then the Python version of _calc_checksum copies each checked frame as well.
+ #
+ # The octets are read directly from the file descriptor of the serial port,
+ # rather than via the serial object, which reads one octet and then fetches
+ # the other available octets in a second call. The thread waits in an epoll
+ # object, in which the serial port and the read end of pipe reader_wake are
+ # registered once. It is woken up either if octets are available or if it is
+ # asked to stop. The descriptor is opened non-blocking by module serial, thus
+ # os.read returns all available octets in one system call. They are read at
+ # once, as a BREAK indicator which is split over two reads is not recognised.
+ #
+ # If the serial port is hung up or in error, epoll reports it upon each wait.
+ # The thread then stops, as does it if a read returns end-of-file or fails,
+ # rather than retrying the read in a loop. An error is logged, unless the
+ # thread is asked to stop.
  #
   def reader( self ):
     self.serial.reset_input_buffer() ;	# Forget history
-    self.iframe= bytearray()		# Empty ingress frame
+    self.iframe_len  = 0		# Empty ingress frame
     self.iframe_time = None		# Time of arrival of first octet of frame
+    buf = self.iframe_buf
+    fd  = self.serial.fd
+    ep  = select.epoll()
+    ep.register( fd, select.EPOLLIN )
+    ep.register( self.reader_wake[0], select.EPOLLIN )
 
     while True:
-      data= self.serial.read(1)		# Wait till next octet arrives
+      hangup= False
+      for efd,mask in ep.poll():	# Wait till next octet arrives
+        if efd == fd  and  mask & (select.EPOLLHUP|select.EPOLLERR):
+          hangup= True
       if not self.reader_alive:		# Stop when asked to
         break
 
-      octcnt= self.serial.in_waiting	# Number of available octets
-      if octcnt > 0:
-        data+= self.serial.read(octcnt)	# A non-blocking read
+      try:
+        data= os.read( fd, SERIAL_Read_size )	# A non-blocking read
+      except BlockingIOError:
+        if hangup:
+          self._log_message( "Port {} is hung up", SERIAL_Device )
+          break
+        continue
+      except OSError as e:
+        if self.reader_alive:
+          self._log_message( "Read error on port {}: {}", SERIAL_Device, e )
+        break
+      if not data:			# End-of-file
+        self._log_message( "Port {} is closed", SERIAL_Device )
+        break
 
-      so= 0				# Search offset
-      while len(data) > 0:
-        if self.iframe_time == None:
+      mv = memoryview( data )		# Move octets without a copy
+      pos= 0				# Offset of first octet to handle
+      so = 0				# Search offset
+      while pos < len(data):
+        if self.iframe_time is None:
           self.iframe_time= time.time()
-        octcnt= data.find( SERIAL_Break, so )	# Location of next end-of-frame
-        if octcnt == -1:
-          self.iframe+= data		# Move partial frame
-          data= b''			# Exit loop
+        brk= data.find( SERIAL_Break, pos+so )	# Location of next end-of-frame
+        if brk == -1:
+          n= self.iframe_len		# Move partial frame
+          buf[n:n+len(data)-pos]= mv[pos:]
+          self.iframe_len= n + len(data) - pos
+          pos= len(data)		# Exit loop
         else:
-          if octcnt > 0:
-            self.iframe+= data[:octcnt]	# Move (last) part of frame
-            data  = data[octcnt:]
-            octcnt= 0
+          if brk > pos:
+            n= self.iframe_len		# Move (last) part of frame
+            buf[n:n+brk-pos]= mv[pos:brk]
+            self.iframe_len= n + brk - pos
+            pos= brk
   # Count the number of consecutive 0xff octets preceding the end-of-frame
   # indicator. If this count is even, it is really an end-of-frame indicator.
   # However if this count is odd, the original octet stream consists of one or
-  # more 0xff octets, followed by at least two 0x00 octets.
-          cnt= 0
-          if len(self.iframe) > 0  and  self.iframe[-1] == SERIAL_Escape:
-            for i in range( len(self.iframe)-1, -1, -1 ):
-              if self.iframe[i] == SERIAL_Escape:
-                cnt+= 1
-              else:
-                break
+  # more 0xff octets, followed by at least two 0x00 octets. The octets are
+  # counted by rstrip, only if the frame ends with a 0xff octet.
+          n= self.iframe_len
+          if n > 0  and  buf[n-1] == SERIAL_Escape:
+            cnt= n - len( buf[:n].rstrip(b'\xff') )
+          else:
+            cnt= 0
           so= cnt % 2			# Set search offset
           if so == 0:			# If a real end-of-frame found
-            octcnt+= len( SERIAL_Break )
-            data= data[octcnt:]		# Skip delimiter
+            pos+= len( SERIAL_Break )	# Skip delimiter
             self._handle_iframe()	# Do L2 handling of frame
 
+    ep.close()
+
  #
  # Method writer is started as a separate thread, which will transmit the
  # supplied frame(s) onto the serial port (== EMS bus). It will wait for a frame
@@ -1079,6 +1358,13 @@ class Emsbus():
  #  in method Calduino::sendBuffer, a wait time of 3 [ms] is inserted between
  #  two successive octets, and an additional wait time of 2 [ms] after the BREAK
  #  has been sent.
+ #
+ # Note: the frames waiting in eframe_queue, for instance the buffered frames and
+ #  the poll reply sent upon a poll request, are not combined into a single
+ #  write. Each frame must be followed by a BREAK, which is the only frame
+ #  delimiter on the EMS bus, and the BREAK is sent by a separate call once the
+ #  frame has been transmitted. The frames are taken from the queue without
+ #  waiting as long as the queue is not empty.
  #
   def writer( self ):
     self.serial.reset_output_buffer()
@@ -1087,19 +1373,36 @@ class Emsbus():
 #   attr[2]&= ~termios.PARODD			# Reset odd-parity-flag
 
     while self.writer_alive:
-      qv= self.eframe_queue.get()
-      self.eframe     = qv['Frame']
-      self.eframe_time= time.time()
-
-      type= qv['Type']
-      self.sbs['egress_total_frames']+= 1
-      self.sbs['egress_total_octets']+= len(self.eframe) + 1
-      self.sbs['egress_{}_frames'.format(type)]+= 1
+      try:
+        qv= self.eframe_queue.popleft()
+      except IndexError:		# Queue is empty
+        self.eframe_ready.wait()
+        self.eframe_ready.clear()
+        continue
+      self.eframe= qv.frame
+
+  # Update the statistics. The length of the frame, excluding the check-sum, is
+  # determined once.
+      type= qv.type
+      n   = len( self.eframe )
+      sbs = self.sbs
+      sbs.egress_total_frames+= 1
+      sbs.egress_total_octets+= n + 1
+      if   type == 'polrep':
+        sbs.egress_polrep_frames+= 1
+      elif type == 'reareq':
+        sbs.egress_reareq_frames+= 1
+      elif type == 'rearep':
+        sbs.egress_rearep_frames+= 1
+      elif type == 'wrireq':
+        sbs.egress_wrireq_frames+= 1
+      elif type == 'wrirep':
+        sbs.egress_wrirep_frames+= 1
 
-      if len( self.eframe ) >= EMSBUS_Min_frame_size:
+      if n >= EMSBUS_Min_frame_size:
         self.eframe.append( 0x00 )	# Append octet to contain the check-sum
         self.eframe[-1]= self._calc_checksum( self.eframe )
-        self.sbs['egress_total_octets']+= 1
+        sbs.egress_total_octets+= 1
 
   # If a ReadRequest frame or a WriteRequest frame is to be sent, notify the
   # ingress_dispatcher that an associated reply is to be expected. The reception
@@ -1110,11 +1413,20 @@ class Emsbus():
       elif type == 'wrireq':
         self.idisp_queue.put( 'WQ' )	# Notify ingress_dispatcher
 
-      t0= time.time()
+#     t0= time.time()
       if self.device == 0x0b:		# Bus master will echo
-        for x in self.eframe:
-          self.serial.write( bytes([x]) )
-          time.sleep( 0.0033 )		# Optimized for my system
+        if self._cpaced is not None:	# Pace octets in C
+          rc= self._cpaced( self.serial.fd, bytes(self.eframe),
+                            len(self.eframe), 3300 )
+          if rc < 0:			# Report error like serial.write
+            errno= ctypes.get_errno()
+            raise OSError( errno, os.strerror(errno) )
+        else:				# Pace octets in Python
+          write= self.serial.write
+          sleep= time.sleep
+          for x in self.eframe:
+            write( bytes([x]) )
+            sleep( 0.0033 )		# Optimized for my system
       else:
         self.serial.write( self.eframe )	# Write / buffer frame
         time.sleep( len(self.eframe)/960.0 )	# Wait for completion
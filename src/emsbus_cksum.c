@@ -0,0 +1,109 @@
+/*
+ * emsbus_cksum.c
+ *
+ * This module contains the C version of the check-sum calculation of a frame on
+ * the EMS-bus and of the removal of the escape sequences from an ingress frame.
+ * They are invoked by methods _calc_checksum and _handle_iframe in module
+ * emsbus.py via ctypes, as they are done for each ingress (and egress) frame.
+ * The algorithms are the same as the ones in emsbus.py, which are used if this
+ * shared library is not available. This module also contains the paced
+ * transmission of an egress frame, used by method writer.
+ *
+ * Build: gcc -O2 -shared -fPIC -o emsbus_cksum.so emsbus_cksum.c
+ */
+#include <errno.h>
+#include <poll.h>
+#include <stddef.h>
+#include <stdint.h>
+#include <time.h>
+#include <unistd.h>
+
+/*
+ * Function ems_cksum computes the check-sum over the first n octets in buffer
+ * buf. It is a shift/XOR check-sum in which each step depends on the previous
+ * one, thus the loop cannot be vectorised. The step is written without a branch
+ * instead: if the most significant bit is set, the shifted check-sum is XOR-ed
+ * with 0x19, which equals ((chks^0x0c)<<1)|0x01.
+ */
+uint8_t ems_cksum( const uint8_t *buf, size_t n )
+{
+  uint8_t chks= 0x00;			/* Checksum preset */
+  size_t  i;
+
+  for ( i= 0; i < n; i++ ) {
+    chks = (uint8_t)(chks << 1) ^ (-(chks >> 7) & 0x19);
+    chks^= buf[i];
+  }
+  return chks;
+}
+
+/*
+ * Function ems_unescape removes the escape sequences from the first n octets in
+ * buffer buf, in place, and returns the length of the result. An escaped 0xff
+ * octet is restored and a framing error indicator (0xff 0x00) is removed, while
+ * the erred octet following it is kept as is. The number of framing errors is
+ * saved in *err. Any other octet following an escape octet, as well as an
+ * indicator at the end of the buffer, is left unchanged.
+ */
+size_t ems_unescape( uint8_t *buf, size_t n, int *err )
+{
+  size_t r= 0, w= 0;			/* Read and write offsets */
+
+  *err= 0;
+  while ( r < n ) {
+    buf[w++]= buf[r++];
+    if ( buf[w-1] != 0xff  ||  r >= n )
+      continue;
+    if ( buf[r] == 0xff ) {		/* Escaped 0xff */
+      r++;
+    } else if ( buf[r] == 0x00  &&  r+1 < n ) {
+      buf[w-1]= buf[r+1];		/* Replace indicator by erred octet */
+      r+= 2;
+      (*err)++;
+    }
+  }
+  return w;
+}
+
+/*
+ * Function ems_send_paced writes the n octets in buffer buf to file descriptor
+ * fd one at a time, with an interval of gap microseconds between the start of
+ * successive octets. The intervals are measured from absolute deadlines, thus
+ * the time needed to write an octet does not accumulate. If a write is delayed,
+ * or a sleep overruns, the next deadline is moved forward to the current time,
+ * thus the gap between two octets is never shorter than the specified one. The
+ * descriptor may be non-blocking. The function returns 0 if all octets are
+ * written, and -1 with errno set otherwise.
+ */
+int ems_send_paced( int fd, const uint8_t *buf, size_t n, long gap )
+{
+  struct timespec due;			/* Deadline of next octet */
+  struct timespec now;
+  struct pollfd   pfd;
+  size_t  i;
+  ssize_t rc;
+
+  pfd.fd    = fd;
+  pfd.events= POLLOUT;
+  clock_gettime( CLOCK_MONOTONIC, &due );
+  for ( i= 0; i < n; i++ ) {
+    while ( (rc= write( fd, buf+i, 1 )) != 1 ) {
+      if ( rc < 0  &&  errno == EAGAIN )
+        poll( &pfd, 1, -1 );		/* Wait for room in output buffer */
+      else if ( rc < 0  &&  errno != EINTR )
+        return -1;
+    }
+    clock_gettime( CLOCK_MONOTONIC, &now );
+    if ( now.tv_sec > due.tv_sec  ||
+        (now.tv_sec == due.tv_sec  &&  now.tv_nsec > due.tv_nsec) )
+      due= now;				/* Deadline has passed */
+    due.tv_nsec+= gap*1000;
+    while ( due.tv_nsec >= 1000000000 ) {
+      due.tv_nsec-= 1000000000;
+      due.tv_sec++;
+    }
+    while ( clock_nanosleep( CLOCK_MONOTONIC, TIMER_ABSTIME, &due, NULL ) == EINTR )
+      ;
+  }
+  return 0;
+}
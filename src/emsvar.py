@@ -6,7 +6,6 @@
 # - Repeating structures
 #
 import datetime
-import time
 
 #
 # Define the offset of the header fields in a frame. The user data starts at
@@ -21,6 +20,39 @@ EMS_Type  = 2
 EMS_Offset= 3
 EMS_Data  = 4
 
+#
+# Function _MakeLocate returns a function which locates a field in a frame. The
+# returned function checks the source and the type of the frame and whether the
+# octets of the field are available in the frame. If so, it returns the offset
+# of the field in the frame, otherwise it returns None.
+#
+# The source of the function is generated with the attributes of the field,
+# which do not change, filled in as constants. The offset range of the octets
+# available in a frame is defined like a slice in Python, starting at the value
+# of the offset field in the frame. Each variant is compiled only once.
+#
+_Locators= {}				# Compiled locate functions
+
+def _MakeLocate( Source, Type, Offset, Size ):
+  Key= (Source,Type,Offset,Size)
+  if Key in _Locators:
+    return _Locators[Key]
+
+  Src= [ 'def _Locate( frame ):',
+         '  if frame[{}] != {}  or  frame[{}] != {}:'.format(
+              EMS_Source, Source, EMS_Type, Type ),
+         '    return None',			# Extraction failed
+         '  fao_start= frame[{}]'.format( EMS_Offset ),
+         '  if {} >= fao_start  and  len(frame) + fao_start >= {}:'.format(
+              Offset, EMS_Data + Offset + Size ),
+         '    return {} - fao_start'.format( EMS_Data + Offset ),
+         '  return None' ]			# Field is not available
+
+  Namespace= {}
+  exec( '\n'.join( Src ), Namespace )
+  _Locators[Key]= Namespace['_Locate']
+  return _Locators[Key]
+
 
 #
 # Generic classes.
@@ -66,20 +98,11 @@ class emsbitvar( emsvar ):
     self.offset= Offset
     self.bitnbr= Bit
     self.value = None
+    self._locate= _MakeLocate( Source, Type, Offset, 1 )
 
   def extract( self, frame, tom ):
-    if super().extract( frame, tom ):
- # Compute the offset range of the octets available in this frame. The range is
- # defined like a slice in Python.
-      fao_start= frame[EMS_Offset]	# Frame available octets, start
-      fao_end  = fao_start + len(frame) - EMS_Data
-      if self.offset >= fao_start  and  self.offset < fao_end:
-        self.actoffset= EMS_Data + self.offset - frame[EMS_Offset]
-        return True
-      else:
-        return False			# Field is not available
-    else:
-      return False			# Extraction failed
+    self.actoffset= self._locate( frame )
+    return self.actoffset is not None
 
 
 class emsbytevar( emsvar ):
@@ -92,20 +115,11 @@ class emsbytevar( emsvar ):
     self.divisor  = Divisor
     self.dimension= Dimension
     self.actoffset= None
+    self._locate  = _MakeLocate( Source, Type, Offset, Size )
 
   def extract( self, frame, tom ):
-    if super().extract( frame, tom ):
- # Compute the offset range of the octets available in this frame. The range is
- # defined like a slice in Python.
-      fao_start= frame[EMS_Offset]	# Frame available octets, start
-      fao_end  = fao_start + len(frame) - EMS_Data
-      if self.offset >= fao_start  and  self.offset+self.size <= fao_end:
-        self.actoffset= EMS_Data + self.offset - frame[EMS_Offset]
-        return True
-      else:
-        return False			# Field is not available
-    else:
-      return False			# Extraction failed
+    self.actoffset= self._locate( frame )
+    return self.actoffset is not None
 
   def get_dimension( self ):
     return self.dimension
@@ -127,6 +141,7 @@ class ems_ascii( emsvar ):
     super().__init__( Name, Source, Type )	# Parent level initialisation
     self.offset= Offset
     self.size  = Size
+    self._locate= _MakeLocate( Source, Type, Offset, Size )
 
  #
  # Method extract checks if the field is available in this frame. If not, it
@@ -134,23 +149,18 @@ class ems_ascii( emsvar ):
  # converted to a string.
  #
   def extract( self, frame, tom ):
-    if super().extract( frame, tom ):
-  # Compute the offset range of the octets available in this frame. The range is
-  # defined like a slice in Python.
-      fao_start= frame[EMS_Offset]	# Frame available octets, start
-      fao_end  = fao_start + len(frame) - EMS_Data
-      if self.offset >= fao_start  and  self.offset+self.size <= fao_end:
-        self.value= frame[EMS_Data+self.offset:EMS_Data+self.offset+self.size].decode('ascii')
-        self.tom  = tom
-        return True
-      else:
-        return False			# Field is not available
-    else:
-      return False			# Extraction failed
+    ao= self._locate( frame )
+    if ao is None:
+      return False			# Field is not available
+    self.value= frame[EMS_Data+self.offset:EMS_Data+self.offset+self.size].decode('ascii')
+    self.tom  = tom
+    return True
 
 
 #
 # Class ems_datetime decodes the date and time as broadcasted by the thermostat.
+# The octets containing the date and time are saved, and the datetime object is
+# only created if they differ from the octets in the previous frame.
 #
 class ems_datetime( emsbytevar ):
   '''Class ems_datetime describes a date and time, with some additional flags.'''
@@ -158,11 +168,15 @@ class ems_datetime( emsbytevar ):
   def __init__( self, Name, Source, Type, Offset, Size ):
     super().__init__( Name, Source, Type, Offset, Size, None, None )	# Parent level initialisation
     self.dtf= None
+    self.raw= None			# Octets of date and time of value
 
   def extract( self, frame, tom ):
     if super().extract( frame, tom ):
-      ao= self.actoffset
-      self.value= datetime.datetime( frame[ao]+2000, frame[ao+1], frame[ao+3], frame[ao+2], frame[ao+4], frame[ao+5] )
+      ao = self.actoffset
+      raw= bytes( frame[ao:ao+6] )
+      if raw != self.raw:
+        self.value= datetime.datetime( raw[0]+2000, raw[1], raw[3], raw[2], raw[4], raw[5] )
+        self.raw  = raw
       self.dtf  = frame[ao+7]		# Date-time flags
       self.tom  = tom
       return True
@@ -200,15 +214,9 @@ class ems_numeric( emsbytevar ):
       ao= self.actoffset
       if self.size >= 2  and frame[ao] == 0x80  and frame[ao+1] == 0x00:
         self.value= None		# Missing sensor
-      else:
-        self.value= 0
-        for x in frame[ao:ao+self.size]:
-          self.value= self.value * 256 + x
-        if frame[ao] & 0x80:		# If number is negative
-          self.value-= 1 << 8*self.size	# Two's complement negative value
-        if self.divisor is None  or  self.divisor == 1:
-          self.value = int( self.value )
-        else:
+      else:				# Two's complement value
+        self.value= int.from_bytes( frame[ao:ao+self.size], 'big', signed=True )
+        if self.divisor is not None  and  self.divisor != 1:
           self.value/= self.divisor
       self.tom= tom
       return True
@@ -237,20 +245,22 @@ class ems_sumima( ems_numeric ):
 
   def extract( self, frame, tom ):
     if super().extract( frame, tom ):
-      if self.value is None:
+      value= self.value
+      if value is None:
         self.value= self.sum_value
       else:
         if self.min_value is None:	# Update min and max
-          self.min_value= self.value
-          self.max_value= self.value
-        else:
-          self.min_value= min( self.min_value, self.value )
-          self.max_value= max( self.max_value, self.value )
+          self.min_value= value
+          self.max_value= value
+        elif value < self.min_value:
+          self.min_value= value
+        elif value > self.max_value:
+          self.max_value= value
 
         if self.prv_value is not None:	# Update integral (sum)
-          self.sum_value+= (self.value + self.prv_value)*0.5*(self.tom - self.prv_time )
-        self.prv_value= self.value
-        self.prv_time = self.tom
+          self.sum_value+= (value + self.prv_value)*0.5*(tom - self.prv_time )
+        self.prv_value= value
+        self.prv_time = tom
         self.value    = self.sum_value
       return True
     else:
@@ -277,7 +287,8 @@ class ems_switch( ems_flag ):
 
 #
 # Class ems_version describes a two-byte field, containing the major and minor
-# version numbers.
+# version numbers. The string is only formatted if the version differs from the
+# version in the previous frame.
 #
 class ems_version( emsbytevar ):
   '''Class ems_version defines a two byte field, containing a major and a minor
@@ -286,11 +297,15 @@ class ems_version( emsbytevar ):
   def __init__( self, Name, Source, Type, Offset, Size ):
     super().__init__( Name, Source, Type, Offset, Size, None, None )	# Parent level initialisation
     self.value= '?.??'
+    self.raw  = None			# Octets of version of value
 
   def extract( self, frame, tom ):
     if super().extract( frame, tom ):
-      ao= self.actoffset
-      self.value= '{:d}.{:02d}'.format( frame[ao], frame[ao+1] )
+      ao = self.actoffset
+      raw= bytes( frame[ao:ao+2] )
+      if raw != self.raw:
+        self.value= '{:d}.{:02d}'.format( raw[0], raw[1] )
+        self.raw  = raw
       self.tom  = tom
       return True
     else:
@@ -7,107 +7,183 @@
 #
 # Written by W.J.M. Nelis, wim.nelis@ziggo.nl, 2019.01
 #
-# Note: a timer is a separate thread. After invoking method cancel, the timer is
-#   stopped (timer.finished.is_set() == True) but the timer thread may still be
-#   alive (timer.is_alive() == True). The time between invoking cancel and the
-#   timer thread becoming inactive should be small. To make sure that method
-#   is_alive will never return True while the timer is stopped, each call to
-#   method cancel is followed by a call to method join.
+# Note: all watchdog timers share a single daemon thread, which is started when
+#   the first timer is created and which lives as long as the process. Each
+#   timer keeps its own deadline. Starting or resetting a timer stores a new
+#   deadline, stopping a timer clears it, and no thread is created or joined.
+#   The call-back functions are invoked by the watchdog thread, one at a time,
+#   thus a call-back function which blocks delays the expiration of all other
+#   timers. A call-back function may start, reset or stop any watchdog timer. An
+#   exception raised by it is reported on stderr and does not stop the thread.
 #
-# Note: Method Threading.Timer.run() invokes the user call-back function upon
-#   expiration of the timer. Upon invocation of the user call-back function,
-#   event timer.finished in not yet set, it will be set upon return. See URL
-#   https://github.com/python/cpython/blob/master/Lib/threading.py. Experience
-#   shows that if a join is attempted while the timer has expired, exception
-#   RunTimeError might be raised with message "cannot join current thread". Thus
-#   this problem might occur in method WatchdogTimer.stop. It is locally solved
-#   with two modifications: (A) by intercepting the call-back and call
-#   timer.finished.set() before the user call-back function is invoked and (B)
-#   by extending method WatchdogTimer.is_alive() to return value False if the
-#   timer has expired.
-#   It is probably better to set event timer.finished in module threading.py
-#   (see aforementioned URL) just before invoking the call-back function.
+import itertools
+import os
+import sys
+import threading
+import time
+import weakref
+
+#
+# Define the administration shared by all watchdog timers. The watchdog thread
+# waits on event _wakeup, either until the earliest deadline or until a timer is
+# started, which might be due earlier.
+#
+_wakeup= threading.Event()
+_timers= weakref.WeakSet()		# All watchdog timers
+_lock  = threading.Lock()		# Protects the membership of _timers
+_generation= itertools.count( 1 )	# Source of deadline generation numbers
+_spin_delay= 1000000			# Spin rather than sleep below this delay [ns]
+
+#
+# Function _run is the body of the watchdog thread. It scans the timers for an
+# expired deadline, invokes the handler of each expired timer and determines
+# the time until the earliest remaining deadline.
+#
+# The times are integer nanoseconds of time.monotonic_ns(), thus the scan needs
+# no floating point arithmetic. Only the delay passed to the event is converted
+# to seconds.
 #
-from threading import Timer
+# The deadline of a timer is a tuple (time,generation), written by the threads
+# using the timer. Each start of a timer takes a new generation number. The
+# generation which has expired is written by the watchdog thread only. A timer
+# is running if its deadline is set and its generation has not expired. Thus a
+# timer which is restarted while it expires is never lost, and it is not needed
+# to wait for the expiration to complete, although a timer which is stopped at
+# that moment may still invoke its handler, like a threading.Timer which is
+# cancelled at that moment. After a handler has been invoked the timers are
+# scanned again, as the expired timer may have been restarted without a wake up
+# of this thread.
+# If the earliest deadline is less than _spin_delay away, the thread yields the
+# processor and scans again rather than sleeping on the event, as a wake up from
+# such a short sleep may be late by more than the remaining delay.
+#
+def _run():
+  while True:
+    with _lock:
+      timers= list( _timers )
+    now  = time.monotonic_ns()
+    delay= None				# Time until earliest deadline [ns]
+    for timer in timers:
+      deadline= timer.deadline
+      if deadline is None  or  deadline[1] == timer.fired:
+        continue			# Timer is not running
+      if deadline[0] <= now:
+        timer.fired  = deadline[1]	# Timer has expired
+        timer.expired= True
+        handler= timer.handler
+        if handler is not None:
+          try:
+            handler()
+          except Exception:
+            sys.excepthook( *sys.exc_info() )
+        delay= 0			# Rescan for restarted timers
+      elif delay is None  or  deadline[0] - now < delay:
+        delay= deadline[0] - now
+    if delay is not None  and  delay < _spin_delay:
+      os.sched_yield()			# Deadline is near, do not sleep
+      continue
+    _wakeup.wait( None if delay is None else delay/1e9 )
+    _wakeup.clear()
+
+#
+# Function _register adds a timer to the administration. The watchdog thread is
+# started upon registration of the first timer, thus no thread is created if no
+# watchdog timer is used.
+#
+_thread= None				# Watchdog thread
+
+def _register( timer ):
+  global _thread
+  with _lock:
+    _timers.add( timer )
+    if _thread is None:
+      _thread= threading.Thread( target=_run, name='wdt', daemon=True )
+      _thread.start()
 
 #
-# Define a simple watchdog timer. A specific exception subclass is defined to
-# handle a time-out for which no handler is defined.
+# Define a simple watchdog timer. An expiration of the timer is recorded in
+# attribute expired, which is cleared when the timer is (re)started. If a
+# handler is defined, it is invoked as well.
+# Previously a time-out for which no handler was defined raised exception
+# WdtTimeoutException in the thread of the timer, where it could not be caught
+# by the application. The exception class is kept for compatibility.
 #
 class WdtTimeoutException( Exception ):
   '''An unhandled time-out of a watchdog timer.'''
 
 class WatchdogTimer:
   '''A simple, stoppable and restartable watchdog timer.'''
-  def __init__( self, to=None, cb=None ):
-    self.timeout= to                    # Time out value [s]
-    self.handler= cb                    # Call back function, parameter-less
-    self.timer  = Timer( 0, True )      # Dummy timer object instance
-
- #
- # Private method and call-back function _handler handles an expiration of the
- # timer. The internal timer state is updated, and the user supplied call-back
- # function is invoked.
  #
-  def _handler( self ):                 # Default time-out handler
-    self.timer.finished.set()           # Timer has stopped
-    if self.handler is None:
-      raise WdtTimeoutException
-    else:
-      self.handler()                    # Invoke user handler
-
- #
- # Private method _start contains the common part of methods start and reset. It
- # stops a timer if there is an active one and starts a new timer using the
- # parameters saved in the object.
+ # An idle timer is represented by deadline None, thus no placeholder timer
+ # object is needed until the timer is started.
  #
-  def _start( self ):
-    if self.is_alive():
-      self.timer.cancel()               # Stop timer
-      self.timer.join()                 # Wait for timer thread to finish
-
-    self.timer= Timer( self.timeout, self._handler )
-    self.timer.start()
-    return True
+  def __init__( self, to=None, cb=None ):
+    self.timeout = to                   # Time out value [s]
+    self.timeout_ns= None if to is None else int( to*1e9 )
+    self.handler = cb                   # Call back function, parameter-less
+    self.deadline= None                 # Deadline (time,generation) of timer
+    self.fired   = 0                    # Generation which has expired
+    self.expired = False                # Timer has expired
+    _register( self )
 
  #
  # Method is_alive returns True if the timer is running, False otherwise.
  #
   def is_alive( self ):
-    return (not self.timer.finished.is_set())  and  self.timer.is_alive()
+    deadline= self.deadline
+    return deadline is not None  and  deadline[1] != self.fired
 
  #
- # Method reset stops the timer if it is running, and creates and starts a new
- # one using the parameters passed to the previous invocation of method start.
- # If previously no timer was defined, this method does nothing and returns
- # False, while it returns True if the timer is restarted.
+ # Method reset stops the timer if it is running, and starts a new one using the
+ # parameters passed to the previous invocation of method start. If previously
+ # no timer was defined, this method does nothing and returns False, while it
+ # returns True if the timer is restarted. The new deadline is set like it is in
+ # method start.
  #
   def reset( self ):                    # Reset a running timer
     if self.timeout is None:
       return False                      # Error: no timer defined
-    return self._start()                # Stop if necessary and start a timer
+    old= self.deadline
+    new= ( time.monotonic_ns() + self.timeout_ns, next(_generation) )
+    self.expired = False
+    self.deadline= new
+    if old is None  or  old[1] == self.fired  or  new[0] < old[0]:
+      _wakeup.set()                     # Notify watchdog thread
+    return True
 
  #
  # Method start starts a new timer. If there was a timer already running, it is
  # stopped without further notice. The returned value is False if no timer is
  # started (because no timeout is specified), otherwise the returned value is
  # True.
+ # The deadline of a running timer, if any, is replaced by the new one. The
+ # watchdog thread is only woken up if the new deadline is earlier than the
+ # deadline it might be waiting for. If the timer is running and its deadline is
+ # postponed, which is the common case of a reset, the thread wakes up at the
+ # old deadline, finds the new one and waits again.
+ # No lock is taken. The time and the generation of the deadline are stored as
+ # one tuple, which the watchdog thread loads in a single step, and next() on
+ # an itertools.count is atomic in CPython.
  #
   def start( self, Timeout, Handler=None ):     # Start a timer
     if Timeout is None:                 # Check for an illegal value
       return False
     self.timeout= Timeout               # Save parameters
+    self.timeout_ns= int( Timeout*1e9 )
     self.handler= Handler
-    return self._start()                # Start a new timer
+    old= self.deadline
+    new= ( time.monotonic_ns() + self.timeout_ns, next(_generation) )
+    self.expired = False
+    self.deadline= new
+    if old is None  or  old[1] == self.fired  or  new[0] < old[0]:
+      _wakeup.set()                     # Notify watchdog thread
+    return True
 
  #
  # Method stop stops the timer if it is running. It returns True if the timer is
  # stopped, False if the timer already is expired.
  #
   def stop( self ):                     # Stop a timer
-    if self.is_alive():
-      self.timer.cancel()
-      self.timer.join()
-      return True
-    else:
-      return False
+    deadline= self.deadline
+    self.deadline= None
+    return deadline is not None  and  deadline[1] != self.fired